@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import markdown
+
+# The renderer version whose Markdown call is frozen below. Rows stamped
+# with it are served without parsing until RENDERER_VERSION is bumped,
+# after which `rerender blogpost` renders them again, like any other row.
+RENDERER_VERSION = 1
+
+
+def render_blogposts(apps, schema_editor):
+    """Store the html of existing blog posts, there are only a few."""
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    for post in BlogPost.objects.exclude(render_version=RENDERER_VERSION)\
+            .only('content').iterator():
+        BlogPost.objects.filter(pk=post.pk).update(
+            content_html=markdown.markdown(post.content, safe_mode='escape'),
+            render_version=RENDERER_VERSION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_rendered_html'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_blogposts, migrations.RunPython.noop),
+    ]
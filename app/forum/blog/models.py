@@ -8,12 +8,12 @@ import os
 from uuslug import uuslug
 from socket import gethostname
 
-from utils.renderer import render
-from forum.models import Category, Thread, Post, SLUG_LENGTH
+from forum.models import Category, Thread, Post, RenderedModel, \
+    SLUG_LENGTH
 from user.models import ForumUser
 
 
-class BlogPost(models.Model):
+class BlogPost(RenderedModel):
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     title = models.CharField(max_length=80, verbose_name='Titre')
     author = models.ForeignKey(
@@ -31,6 +31,9 @@ class BlogPost(models.Model):
         related_name='blog_post',
         on_delete=models.CASCADE)
 
+    markup = 'markdown'
+    source_field = 'content'
+
     def save(self, *args, **kwargs):
         # Create unique slug
         self.slug = uuslug(self.title,
@@ -48,12 +51,9 @@ class BlogPost(models.Model):
                 this.image.delete()
         except:
             pass
+        self.render_html()
         super().save(*args, **kwargs)
 
-    @property
-    def html(self):
-        return render(self.content, 'markdown')
-
     def __str__(self):
         return self.title
 
@@ -1,12 +1,14 @@
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.core.urlresolvers import reverse_lazy
 
+from utils.counters import view_counter
 from .models import BlogPost
 from .forms import PostForm
 
 
 class TopView(ListView):
-    model = BlogPost
+    queryset = BlogPost.objects.select_related(
+        'author', 'forum_thread__category')
     paginate_by = 5
 
 
@@ -14,6 +16,11 @@ class PostView(DetailView):
     model = BlogPost
     context_object_name = 'p'
 
+    def get_object(self, queryset=None):
+        post = super().get_object(queryset)
+        view_counter.incr(post, 'views')
+        return post
+
 
 class NewPost(CreateView):
     model = BlogPost
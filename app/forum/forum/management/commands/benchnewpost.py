@@ -0,0 +1,94 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, \
+    setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+from django.utils import timezone
+
+from collections import Counter
+import datetime
+
+from forum.models import Category, Thread, Post
+from user.models import ForumUser
+
+LOCMEM = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+CACHE_METHODS = ('get', 'get_many', 'set', 'set_many', 'add', 'delete',
+                 'delete_many', 'incr', 'decr')
+
+
+class CacheCounter(object):
+    """Count the calls made to the default cache backend."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.backend = caches['default']
+
+    def __enter__(self):
+        for name in CACHE_METHODS:
+            method = getattr(self.backend, name)
+
+            def counted(*args, _name=name, _method=method, **kwargs):
+                self.calls[_name] += 1
+                return _method(*args, **kwargs)
+            setattr(self.backend, name, counted)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name in CACHE_METHODS:
+            delattr(self.backend, name)
+
+
+class Command(BaseCommand):
+    help = ("Count the queries and cache operations of posting replies "
+            "with NewPost, in a throwaway test database and local cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=5)
+        parser.add_argument('--verbose-sql', action='store_true')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # Not to mix the test database's rows into the real cache
+            with override_settings(CACHES=LOCMEM):
+                self.bench(options['posts'], options['verbose_sql'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def bench(self, posts, verbose_sql):
+        user = ForumUser.objects.create_user(
+            'benchnewpost', 'benchnewpost@example.com')
+        category = Category.objects.create(
+            slug='benchnewpost', title='Bench', subtitle='NewPost')
+        thread = Thread.objects.create(
+            title='Bench', author=user, category=category)
+        Post.objects.create(
+            thread=thread, author=user, content_plain='First post')
+        client = Client()
+        client.force_login(user)
+        url = reverse('forum:new_post', kwargs={
+            'category_slug': category.slug, 'thread_slug': thread.slug})
+        for i in range(posts):
+            # Get past the flood check of PostForm
+            user.posts.update(
+                created=timezone.now() - datetime.timedelta(minutes=1))
+            with CaptureQueriesContext(connection) as queries, \
+                    CacheCounter() as cache_calls:
+                response = client.post(url, {
+                    'content_plain': "Reply {} :) [b]bold[/b]".format(i),
+                })
+            assert response.status_code == 302, response.status_code
+            self.stdout.write("{:d} queries, {:d} cache operations "
+                              "({})".format(
+                                  len(queries),
+                                  sum(cache_calls.calls.values()),
+                                  dict(cache_calls.calls)))
+            if verbose_sql:
+                for query in queries.captured_queries:
+                    self.stdout.write("    " + query['sql'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from forum.models import Category, Thread, Post
+
+
+def counted_posts(field):
+    """Subquery counting the posts whose `field` is the outer row."""
+    return Coalesce(Subquery(
+        Post.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count')), 0)
+
+
+class Command(BaseCommand):
+    help = "Fix the post counts of threads and categories that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        for model, field in ((Thread, 'thread'),
+                             (Category, 'thread__category')):
+            drifted = model.objects.annotate(actual=counted_posts(field))\
+                .exclude(post_count=F('actual'))
+            for obj in drifted:
+                self.stdout.write("{} {}: {} instead of {}".format(
+                    model.__name__, obj.pk, obj.post_count, obj.actual))
+            if not options['dry_run']:
+                # Recount in the UPDATE itself not to lose concurrent posts
+                model.objects.filter(pk__in=[obj.pk for obj in drifted])\
+                    .update(post_count=counted_posts(field))
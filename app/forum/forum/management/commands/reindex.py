@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from itertools import islice
+
+from forum.models import index_for_search, SEARCH_INDEXED
+
+
+class Command(BaseCommand):
+    help = "Recompute the search vectors of every thread and post."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        size = options['chunk_size']
+        for name, (model, field) in SEARCH_INDEXED.items():
+            # Streamed from a server-side cursor, not loaded at once
+            pks = model.objects.order_by('pk')\
+                .values_list('pk', flat=True).iterator()
+            done = 0
+            for chunk in iter(lambda: list(islice(pks, size)), []):
+                index_for_search(name, chunk)
+                done += len(chunk)
+                self.stdout.write("{}: {:d} indexed".format(name, done))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from itertools import islice
+from psycopg2.extras import execute_values
+import time
+
+from blog.models import BlogPost
+from forum.models import Post
+from pm.models import Message
+from utils.renderer import render_many, render_cache_stats, \
+    RENDERER_VERSION
+
+MODELS = {'post': Post, 'message': Message, 'blogpost': BlogPost}
+
+# Rows edited meanwhile were rendered at save time, leave them alone
+UPDATE_SQL = """
+UPDATE {table} AS t SET content_html = v.html, render_version = {version}
+FROM (VALUES %s) AS v (id, html)
+WHERE t.id = v.id AND t.render_version <> {version}
+"""
+
+
+class Command(BaseCommand):
+    help = ("Render the stored html of posts, messages and blog posts "
+            "rendered by a former renderer version. Interrupted runs resume "
+            "where they stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', default=list(MODELS),
+                            help="Among {}, all by default.".format(
+                                ", ".join(MODELS)))
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        unknown = set(options['models']) - set(MODELS)
+        if unknown:
+            raise CommandError("Unknown models: " + ", ".join(unknown))
+        for name in options['models']:
+            self.rerender(MODELS[name], options['chunk_size'])
+
+    def rerender(self, model, size):
+        stale = model.objects.exclude(render_version=RENDERER_VERSION)
+        total = stale.count()
+        if not total:
+            self.stdout.write("{}: up to date".format(
+                model._meta.model_name))
+            return
+        rows = stale.order_by('pk')\
+            .values_list('pk', model.source_field).iterator()
+        chunks = iter(lambda: list(islice(rows, size)), [])
+        sql = UPDATE_SQL.format(table=model._meta.db_table,
+                                version=RENDERER_VERSION)
+        done, start = 0, time.monotonic()
+        for chunk in chunks:
+            pks, texts = zip(*chunk)
+            rendered = list(zip(pks, render_many(
+                texts, model.markup, pool=True)))
+            with connection.cursor() as cursor:
+                execute_values(cursor, sql, rendered,
+                               template="(%s, %s)",
+                               page_size=len(rendered))
+            done += len(rendered)
+            self.stdout.write(
+                "{}: {:d}/{:d} rendered, {:.0f}/s, {:d} render cache "
+                "hits".format(model._meta.model_name, done, total,
+                              done / (time.monotonic() - start),
+                              render_cache_stats['hits']))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from forum.models import process_search_queue, search_queue_lag
+
+
+class Command(BaseCommand):
+    help = ("Index the posts and threads queued for search, in batches, "
+            "until interrupted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty.")
+        parser.add_argument('--lag', action='store_true',
+                            help="Only print the queue's lag.")
+
+    def write_lag(self):
+        pending, age = search_queue_lag()
+        self.stdout.write("{:d} pending, oldest queued {:.1f}s ago".format(
+            pending, age))
+
+    def handle(self, *args, **options):
+        if options['lag']:
+            return self.write_lag()
+        while True:
+            start = time.monotonic()
+            indexed = process_search_queue(options['batch_size'])
+            if indexed:
+                self.stdout.write("Indexed {:d} in {:.2f}s".format(
+                    indexed, time.monotonic() - start))
+                self.write_lag()
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0005_remove_post_markup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='position',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE forum_post SET position = positions.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY thread_id ORDER BY id) - 1 AS position
+                FROM forum_post
+            ) AS positions
+            WHERE forum_post.id = positions.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('thread', 'position')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:06
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0006_post_position'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='thread',
+            index_together=set([('category', 'slug'), ('category', 'isSticky', 'modified')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0007_thread_seek_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='post_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE forum_thread SET post_count = (
+                SELECT COUNT(*) FROM forum_post
+                WHERE forum_post.thread_id = forum_thread.id
+            );
+            UPDATE forum_category SET post_count = (
+                SELECT COALESCE(SUM(post_count), 0) FROM forum_thread
+                WHERE forum_thread.category_id = forum_category.id
+            );
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
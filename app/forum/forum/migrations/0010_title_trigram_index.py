@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions "
+                       "WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return  # Without contrib, substring searches stay unindexed
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Same expression as the SQL of Django's icontains and istartswith
+    schema_editor.execute(
+        "CREATE INDEX forum_thread_title_trgm ON forum_thread "
+        "USING gin (UPPER(title::text) gin_trgm_ops)")
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS forum_thread_title_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0009_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
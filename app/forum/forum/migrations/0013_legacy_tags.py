@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+CHUNK_SIZE = 10000
+LEGACY_TAGS = {'ita': 'i', 'bold': 'b', 'under': 'u'}
+
+# Rewrite the legacy tags of a range of rows, queueing rewritten posts for
+# search indexing, in one statement
+REWRITE_SQL = """
+WITH rewritten AS (
+    UPDATE {table} SET content_plain = {rewrite}
+    WHERE id >= %(start)s AND id < %(end)s
+        AND content_plain ~ '\\[/?(ita|bold|under)\\]'
+    RETURNING id
+)
+{queue}
+"""
+QUEUE_SQL = """
+INSERT INTO forum_searchqueue (model, object_id, created)
+SELECT 'post', id, now() FROM rewritten
+"""
+
+
+def rewrite_legacy_tags(apps, schema_editor):
+    """
+    Rewrite legacy tags by chunks of rows, each committed on its own so
+    that an interrupted migration resumes with the rows left.
+    """
+    rewrite = 'content_plain'
+    for old, new in LEGACY_TAGS.items():
+        rewrite = r"regexp_replace({}, '\[(/?){}\]', '[\1{}]', 'g')".format(
+            rewrite, old, new)
+    with schema_editor.connection.cursor() as cursor:
+        for table, queue in (('forum_post', QUEUE_SQL),
+                             ('pm_message', 'SELECT COUNT(*) FROM rewritten')):
+            cursor.execute("SELECT MAX(id) FROM {}".format(table))
+            last = cursor.fetchone()[0] or 0
+            sql = REWRITE_SQL.format(table=table, rewrite=rewrite,
+                                     queue=queue)
+            for start in range(0, last + 1, CHUNK_SIZE):
+                cursor.execute(sql, {'start': start,
+                                     'end': start + CHUNK_SIZE})
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('forum', '0012_rendered_html'),
+        ('pm', '0005_rendered_html'),
+    ]
+
+    operations = [
+        migrations.RunPython(rewrite_legacy_tags, migrations.RunPython.noop),
+    ]
@@ -1,50 +1,271 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
-from django.db.models.signals import post_save
+from django.db.models import Count, F, Min
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 
+from array import array
+from hashlib import md5
+import threading
 from uuslug import uuslug
 
-from utils.renderer import render
-from .util import keygen
-from user.models import ForumUser, Bookmark
+from utils.bbcode import parse_cached
+from utils.renderer import render, render_many, rm_legacy_tags, \
+    RENDERER_VERSION
+from .util import keygen, normalize_query
+from user.models import ForumUser, Bookmark, AuthorCard, user_map, \
+    cache_author_cards, author_card, author_cards
 
 SLUG_LENGTH = 50
+SEARCH_CONFIG = 'french'
+# Bumped when threads or posts change to invalidate cached search results
+SEARCH_GENERATION_KEY = 'search/generation/{}'
 
 
 # Abstract models
 class CachedAuthorModel(models.Model):
     """Gets author from cache else from db and create cache"""
 
-    @property
+    @cached_property
     def cached_author(self):
-        author = cache.get('user/{}'.format(self.author_id))
-        if not author:
-            author = ForumUser.objects.get(pk=self.author_id)
-            cache.set('user/{}'.format(self.author_id), author, None)
-        return author
+        return author_card(self.author_id)
+
+    class Meta:
+        abstract = True
+
+
+class RenderedModel(models.Model):
+    """
+    Stores the html rendered at save time along with the row. Rows rendered
+    by a former renderer version fall back to the render cache.
+    """
+    content_html = models.TextField(default='', editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0,
+                                                      editable=False)
+
+    markup = 'bbcode'
+    source_field = 'content_plain'
+
+    def render_html(self):
+        text = getattr(self, self.source_field)
+        if self.markup == 'bbcode':  # Not to render them at each render
+            text = rm_legacy_tags(text)
+            setattr(self, self.source_field, text)
+        self.content_html = render(text, self.markup)
+        self.render_version = RENDERER_VERSION
+
+    @cached_property
+    def html(self):
+        if self.render_version == RENDERER_VERSION:
+            return self.content_html
+        return render(getattr(self, self.source_field), self.markup)
 
     class Meta:
         abstract = True
 
 
+def prefetch_html_and_authors(objects):
+    """
+    Load the authors of a page of posts or messages with a single
+    cache.get_many, sharing them through the request's identity map. The
+    html of those rendered by a former renderer is rendered in one batch.
+    """
+    objects = list(objects)
+    cards = user_map()
+    stale = [o for o in objects if o.render_version != RENDERER_VERSION]
+    if stale:
+        for o, html in zip(stale, render_many(
+                [getattr(o, o.source_field) for o in stale],
+                stale[0].markup)):
+            o.html = html
+    author_keys = {AuthorCard.key(o.author_id): o.author_id
+                   for o in objects if o.author_id not in cards}
+    cached = cache.get_many(list(author_keys))
+    cards.update({pk: AuthorCard(*cached[key])
+                  for key, pk in author_keys.items() if cached.get(key)})
+    missing_authors = [pk for pk in author_keys.values() if pk not in cards]
+    if missing_authors:
+        cards.update(cache_author_cards(missing_authors))
+    for o in objects:
+        o.cached_author = cards[o.author_id]
+    return objects
+
+
+class LatestPost(object):
+    """
+    What thread lists show of a thread's latest post. Cached as a plain
+    tuple under a versioned key instead of a pickled Post.
+    """
+    version = 1
+    fields = ('pk', 'position', 'created', 'author_id')
+    __slots__ = fields + ('cached_author',)
+
+    def __init__(self, pk, position, created, author_id):
+        self.pk = pk
+        self.position = position
+        self.created = created
+        self.author_id = author_id
+        self.cached_author = None  # Set along with the thread's author
+
+    @classmethod
+    def from_post(cls, post):
+        return cls(*(getattr(post, name) for name in cls.fields))
+
+    @staticmethod
+    def key(thread_pk):
+        return 'thread/{}/latest_post/{}'.format(thread_pk,
+                                                  LatestPost.version)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+
+def latest_posts(thread_pks):
+    """
+    Return a dict thread pk:LatestPost read with a single cache.get_many,
+    missing ones being loaded with a single query.
+    """
+    keys = {LatestPost.key(pk): pk for pk in thread_pks}
+    cached = cache.get_many(list(keys))
+    posts = {pk: LatestPost(*cached[key])
+             for key, pk in keys.items() if key in cached}
+    missing = [pk for pk in keys.values() if pk not in posts]
+    if missing:
+        misses = {thread: LatestPost(*values) for thread, *values in
+                  Post.objects.filter(thread__in=missing)
+                  .order_by('thread_id', '-created').distinct('thread_id')
+                  .values_list('thread_id', *LatestPost.fields)}
+        cache.set_many({LatestPost.key(pk): post.as_tuple()
+                        for pk, post in misses.items()}, None)
+        posts.update(misses)
+    return posts
+
+
+def prefetch_thread_summaries(threads):
+    """
+    Attach their latest post to threads, and the author card of each
+    thread and latest post, with one cache round-trip for the posts and one
+    for the authors whatever the number of threads.
+    """
+    threads = list(threads)
+    posts = latest_posts([t.pk for t in threads])
+    authors = author_cards([t.author_id for t in threads] +
+                           [p.author_id for p in posts.values()])
+    for t in threads:
+        t.cached_author = authors[t.author_id]
+        t.latest_post = posts.get(t.pk)
+        if t.latest_post is not None:
+            t.latest_post.cached_author = authors[t.latest_post.author_id]
+    return threads
+
+
+def prefetch_category_summaries(categories):
+    """
+    Attach their latest thread and its latest post to categories annotated
+    with latest_thread_id, with a constant number of queries and cache
+    round-trips whatever the number of categories.
+    """
+    categories = list(categories)
+    threads = Thread.objects.in_bulk(
+        [c.latest_thread_id for c in categories if c.latest_thread_id])
+    prefetch_thread_summaries(threads.values())
+    for c in categories:
+        c.latest_thread = threads.get(c.latest_thread_id)
+    return categories
+
+
+def pack_ids(ids):
+    return array('i', ids).tobytes()
+
+
+def unpack_ids(data):
+    ids = array('i')
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+def thread_contributors(threads):
+    """
+    Return a dict thread pk: frozenset of its contributors' pks, read from
+    packed id arrays with a single cache.get_many, missing ones being
+    loaded with a single query.
+    """
+    keys = {Thread.contributors_key.format(t.pk): t.pk for t in threads}
+    cached = cache.get_many(list(keys))
+    contributors = {pk: unpack_ids(cached[key])
+                    for key, pk in keys.items() if key in cached}
+    missing = {pk: [] for pk in keys.values() if pk not in contributors}
+    if missing:
+        for thread, user in Thread.contributors.through.objects\
+                .filter(thread__in=list(missing))\
+                .values_list('thread_id', 'forumuser_id'):
+            missing[thread].append(user)
+        cache.set_many({Thread.contributors_key.format(pk): pack_ids(ids)
+                        for pk, ids in missing.items()}, None)
+        contributors.update(
+            {pk: frozenset(ids) for pk, ids in missing.items()})
+    return contributors
+
+
+def search_key(mode, query_string, page):
+    """Cache key of a page of search results, the same for equal queries."""
+    terms = sorted({term.lower() for term in normalize_query(query_string)})
+    return 'search/{}/{}/{}'.format(
+        mode, md5('\n'.join(terms).encode()).hexdigest(), page)
+
+
+def bump_search_generation(name):
+    try:
+        cache.incr(SEARCH_GENERATION_KEY.format(name))
+    except ValueError:  # Not cached, so no cached result either
+        pass
+
+
+def index_for_search(name, pks):
+    """Compute the search vectors of the given posts or threads."""
+    model, field = SEARCH_INDEXED[name]
+    model.objects.filter(pk__in=pks).update(
+        search_vector=SearchVector(field, config=SEARCH_CONFIG))
+
+
+def process_search_queue(batch_size=500):
+    """Index a batch of queued posts and threads, return its size."""
+    with transaction.atomic():
+        # Concurrent workers each lock and get their own batch
+        entries = list(SearchQueue.objects.select_for_update(
+            skip_locked=True).order_by('pk')[:batch_size])
+        for name in SEARCH_INDEXED:
+            pks = {e.object_id for e in entries if e.model == name}
+            if pks:
+                index_for_search(name, pks)
+                transaction.on_commit(
+                    lambda name=name: bump_search_generation(name))
+        SearchQueue.objects.filter(pk__in=[e.pk for e in entries]).delete()
+    return len(entries)
+
+
+def search_queue_lag():
+    """Return the number of queued entries and the age of the oldest."""
+    lag = SearchQueue.objects.aggregate(
+        pending=Count('pk'), oldest=Min('created'))
+    if lag['oldest'] is None:
+        return 0, 0.0
+    return lag['pending'], (timezone.now() - lag['oldest']).total_seconds()
+
+
 # Basic Forum models
 class Category(models.Model):
     """Contains threads."""
     slug = models.SlugField(blank=False, unique=True, db_index=True)
     title = models.CharField(max_length=50, blank=False)
     subtitle = models.CharField(max_length=200)
-
-    @property
-    def post_count(self):
-        key = f"category/{self.pk}/post_count"
-        count = cache.get(key)
-        if not count:
-            count = Post.objects.filter(thread__category__pk=self.pk).count()
-            cache.set(key, count, None)
-        return count
+    post_count = models.IntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["pk"]
@@ -79,15 +300,16 @@ class Thread(CachedAuthorModel):
     personal = models.BooleanField(default=False)
     visible = models.BooleanField(default=True)
     cessionToken = models.CharField(max_length=50, unique=True)
+    post_count = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Versioned apart from the pickled querysets once cached under
+    # 'thread/{}/contributors'
+    contributors_key = 'thread/{}/contributor_ids/1'
 
     @property
-    def post_count(self):
-        key = f"thread/{self.pk}/post_count"
-        count = cache.get(key)
-        if not count:
-            count = self.posts.count() - 1
-            cache.set(key, count, None)
-        return count
+    def reply_count(self):
+        return max(self.post_count - 1, 0)
 
     def save(self, *args, **kwargs):
 
@@ -105,39 +327,60 @@ class Thread(CachedAuthorModel):
                 if not queryset.filter(cessionToken=token).exists():
                     return token
 
-        new_slug = make_slug(self, self.title)
-        if self.pk is not None:  # This is an existing thread
-            orig = Thread.objects.get(pk=self.pk)
-            # Delete template cache when needed and create new slug
-            if orig.slug != new_slug or orig.icon != self.icon:
-                self.slug = new_slug
-                key = make_template_fragment_key(
-                    'thread', [self.pk])
-                cache.delete(key)  # Fails silently
+        changed = self.changed_fields()
+        if changed is None:  # New thread, or not loaded from the db
+            self.slug = make_slug(self, self.title)
+            if self.pk is None or self.cessionToken == 'tmp':
+                self.cessionToken = create_token(self)
+        else:  # Existing thread: only update what has changed
+            if 'title' in changed or 'category_id' in changed:
+                self.slug = make_slug(self, self.title)
             # Change cessionToken if the author has changed or db migration
-            if orig.author != self.author or self.cessionToken == 'tmp':
+            if 'author_id' in changed or self.cessionToken == 'tmp':
                 self.cessionToken = create_token(self)
-        else:  # This is a new thread
-            # Create slug
-            self.slug = new_slug
-            # Create initial cessionToken
-            self.cessionToken = create_token(self)
         if not self.slug:  # Prevent slugs to be empty
             self.slug = make_slug(self, 'sans titre')
+        if changed is not None and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = self.changed_fields()
         super().save(*args, **kwargs)
-
-    @property
+        self._loaded = dict(getattr(self, '_loaded', {}),
+                            **self.field_values(kwargs.get('update_fields')))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        thread = super().from_db(db, field_names, values)
+        thread._loaded = dict(zip(field_names, values))
+        return thread
+
+    def field_values(self, names=None):
+        return {f.attname: getattr(self, f.attname)
+                for f in self._meta.concrete_fields
+                if names is None or f.name in names or f.attname in names}
+
+    def changed_fields(self):
+        """
+        Return the fields modified since the thread was loaded or saved,
+        None if unknown.
+        """
+        if self.pk is None or not hasattr(self, '_loaded'):
+            return None
+        return [name for name, value in self.field_values().items()
+                if name in self._loaded and self._loaded[name] != value]
+
+    @cached_property
     def latest_post(self):
-        latest_post = cache.get('thread/{}/latest_post'.format(self.pk))
-        if not latest_post:
-            latest_post = self.posts.latest()
-            cache.set(
-                'thread/{}/latest_post'.format(self.pk), latest_post, None)
+        latest_post = latest_posts([self.pk]).get(self.pk)
+        if latest_post is not None:
+            latest_post.cached_author = author_card(latest_post.author_id)
         return latest_post
 
     class Meta:
         ordering = ["-isSticky", "-modified", "pk"]
-        index_together = ['category', 'slug']
+        index_together = [
+            ['category', 'slug'],
+            ['category', 'isSticky', 'modified'],
+        ]
+        indexes = [GinIndex(fields=['search_vector'])]
         # Permit category.threads.latest in template
         get_latest_by = "modified"
 
@@ -145,7 +388,98 @@ class Thread(CachedAuthorModel):
         return "{}/{}".format(self.category.slug, self.slug)
 
 
-class Post(CachedAuthorModel):
+# Bump the thread (locking its row until commit) and the category of a new
+# post, and add its author to the thread's contributors, in one statement
+# returning whether the author is a new contributor
+NEW_POST_SQL = """
+WITH thread AS (
+    UPDATE forum_thread
+    SET modified = %(created)s, post_count = post_count + 1
+    WHERE id = %(thread)s
+    RETURNING category_id
+), contributor AS (
+    INSERT INTO forum_thread_contributors (thread_id, forumuser_id)
+    VALUES (%(thread)s, %(author)s)
+    ON CONFLICT DO NOTHING
+    RETURNING forumuser_id
+)
+UPDATE forum_category SET post_count = post_count + 1
+WHERE id = (SELECT category_id FROM thread)
+RETURNING (SELECT COUNT(*) FROM contributor)
+"""
+
+# Close the gaps left in threads' positions from a given one in each,
+# whatever the order in which the posts before it were deleted
+RENUMBER_POSTS_SQL = """
+UPDATE forum_post SET position = renumbered.position
+FROM (
+    SELECT p.id, s.start - 1 + row_number() OVER (
+        PARTITION BY p.thread_id ORDER BY p.position, p.id) AS position
+    FROM forum_post p
+    JOIN unnest(%(threads)s::integer[], %(starts)s::integer[])
+        AS s(thread_id, start)
+        ON p.thread_id = s.thread_id AND p.position >= s.start
+) AS renumbered
+WHERE forum_post.id = renumbered.id
+AND forum_post.position <> renumbered.position
+"""
+
+# Count deleted posts out of their threads and categories in one statement
+DELETED_POSTS_SQL = """
+WITH deleted AS (
+    SELECT * FROM unnest(%(threads)s::integer[], %(categories)s::integer[],
+                         %(counts)s::integer[])
+        AS d(thread_id, category_id, count)
+), thread AS (
+    UPDATE forum_thread t SET post_count = t.post_count - d.count
+    FROM deleted d WHERE t.id = d.thread_id
+)
+UPDATE forum_category c SET post_count = c.post_count - d.count
+FROM (
+    SELECT category_id, SUM(count) AS count FROM deleted
+    GROUP BY category_id
+) AS d
+WHERE c.id = d.category_id
+"""
+
+
+def move_post_count(thread_pk, delta):
+    Thread.objects.filter(pk=thread_pk)\
+        .update(post_count=F('post_count') + delta)
+    Category.objects.filter(threads=thread_pk)\
+        .update(post_count=F('post_count') + delta)
+
+
+def renumber_posts(starts):
+    """Renumber the posts of threads from a dict thread pk:position."""
+    with connection.cursor() as cursor:
+        cursor.execute(RENUMBER_POSTS_SQL, {
+            'threads': list(starts), 'starts': list(starts.values())})
+
+
+_deleted_posts = threading.local()
+
+
+class DeletedPosts(dict):
+    """
+    Thread pk: [category pk, count, lowest position] of the posts deleted
+    by a transaction, applied to all their threads at once on commit.
+    """
+
+    def __call__(self):
+        if getattr(_deleted_posts, 'pending', None) is self:
+            _deleted_posts.pending = None
+        with connection.cursor() as cursor:
+            cursor.execute(DELETED_POSTS_SQL, {
+                'threads': list(self),
+                'categories': [v[0] for v in self.values()],
+                'counts': [v[1] for v in self.values()],
+            })
+        renumber_posts({pk: v[2] for pk, v in self.items()})
+        cache.delete_many([LatestPost.key(pk) for pk in self])
+
+
+class Post(CachedAuthorModel, RenderedModel):
     """A post."""
     created = models.DateTimeField(default=timezone.now,
                                    editable=False)
@@ -160,24 +494,64 @@ class Post(CachedAuthorModel):
         Thread,
         related_name='posts',
         on_delete=models.CASCADE)
+    position = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post._loaded_thread_id = post.__dict__.get('thread_id')
+        return post
 
     def save(self, *args, **kwargs):
-        self.thread.contributors.add(self.author)
-        if self.pk is None:  # Which means this is a new post, not an edit
+        self.render_html()  # Before the transaction not to hold its locks
+        if self.pk is not None:  # This is an edit
+            loaded = getattr(self, '_loaded_thread_id', None)
+            if loaded is None or loaded == self.thread_id:
+                return super().save(*args, **kwargs)
+            with transaction.atomic():  # Moved to the end of another thread
+                # Also locks both threads' rows until commit
+                move_post_count(loaded, -1)
+                move_post_count(self.thread_id, 1)
+                start = self.position
+                self.position = Post.objects.filter(thread=self.thread_id)\
+                    .aggregate(position=Coalesce(
+                        models.Max('position') + 1, 0))['position']
+                super().save(*args, **kwargs)
+                renumber_posts({loaded: start})
+                transaction.on_commit(lambda: cache.delete_many([
+                    LatestPost.key(loaded), LatestPost.key(self.thread_id),
+                    make_template_fragment_key('thread', [loaded])]))
+            self._loaded_thread_id = self.thread_id
+            return
+        with transaction.atomic():
             self.thread.modified = self.created
-            self.thread.save()
-        super().save(*args, **kwargs)
-
-    @property
-    def html(self):
-        html = cache.get('post/{}/html'.format(self.pk))
-        if not html:
-            html = render(self.content_plain, 'bbcode')
-            cache.set('post/{}/html'.format(self.pk), html, None)
-        return html
+            with connection.cursor() as cursor:
+                cursor.execute(NEW_POST_SQL, {
+                    'thread': self.thread_id,
+                    'author': self.author_id,
+                    'created': self.created,
+                })
+                if cursor.fetchone()[0]:
+                    # Reloaded in one query by the next thread list
+                    transaction.on_commit(lambda: cache.delete(
+                        Thread.contributors_key.format(self.thread_id)))
+            # Read once the thread's row is locked, hence a new statement
+            self.position = self.thread.posts.aggregate(
+                position=Coalesce(models.Max('position') + 1, 0)
+            )['position']
+            super().save(*args, **kwargs)
+        self._loaded_thread_id = self.thread_id
+
+    @cached_property
+    def bbcode(self):
+        """Syntax tree of the post's bbcode."""
+        return parse_cached(self.content_plain)
 
     class Meta:
         ordering = ["pk"]
+        index_together = ['thread', 'position']
+        indexes = [GinIndex(fields=['search_vector'])]
         # Permit thread.posts.latest in template
         get_latest_by = "created"
 
@@ -192,13 +566,33 @@ class Preview(models.Model):
 
     @property
     def html(self):
-        html = render(self.content_plain, self.markup)
+        text = self.content_plain
+        if self.markup == 'bbcode':  # As it will be saved
+            text = rm_legacy_tags(text)
+        html = render(text, self.markup)
         return html
 
     def __str__(self):
         return "{:d}".format(self.pk)
 
 
+class SearchQueue(models.Model):
+    """Outbox of the posts and threads waiting to be indexed for search."""
+    model = models.CharField(max_length=10)  # A key of SEARCH_INDEXED
+    object_id = models.IntegerField()
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "{:s} {:d}".format(self.model, self.object_id)
+
+
+# Text indexed by search for each queued model name
+SEARCH_INDEXED = {
+    'post': (Post, 'content_plain'),
+    'thread': (Thread, 'title'),
+}
+
+
 # Poll models
 class PollQuestion(models.Model):
     question_text = models.CharField(max_length=80)
@@ -230,36 +624,58 @@ class PollChoice(models.Model):
 # Model signal handlers
 @receiver(post_save, sender=Post)
 def update_post_cache(created, instance, **kwargs):
-    html = render(instance.content_plain, "bbcode")
-    cache.set("post/{}/html".format(instance.pk), html, None)
-    if created:
-        cache.set("thread/{}/contributors".format(instance.thread.pk),
-                  instance.thread.contributors.all(), None)
-        cache.set('thread/{}/latest_post'.format(instance.thread.pk),
-                  instance, None)
+    """Update the thread's caches once the post is committed."""
 
+    def update():
+        if created:
+            cache.set(LatestPost.key(instance.thread_id),
+                      LatestPost.from_post(instance).as_tuple(), None)
+        cache.delete(make_template_fragment_key(
+            'thread', [instance.thread_id]))
 
-@receiver(post_save, sender=Post)
-def update_thread_cache(created, instance, **kwargs):
-    cache.delete(make_template_fragment_key('thread', [instance.thread.pk]))
+    transaction.on_commit(update)
 
 
 @receiver(post_save, sender=Thread)
 def update_thread_cache(created, instance, **kwargs):
     cache.delete(make_template_fragment_key('thread', [instance.pk]))
+    transaction.on_commit(lambda: bump_search_generation('thread'))
 
 
 @receiver(post_save, sender=Post)
-def update_post_count(created, instance, **kwargs):
-    if created:
-        category = instance.thread.category.pk
-        thread = instance.thread.pk
-        cache.set(f"category/{category}/post_count",
-                  Post.objects.filter(thread__category__pk=category).count(),
-                  None)
-        cache.set(f"thread/{thread}/post_count",
-                  instance.thread.posts.count() - 1,
-                  None)
+@receiver(post_save, sender=Thread)
+def queue_search_indexing(sender, instance, update_fields, **kwargs):
+    """Queue the indexing in the saving transaction, to be done later."""
+    if sender is Thread and update_fields is not None and \
+            'title' not in update_fields:
+        return
+    SearchQueue.objects.create(
+        model=sender.__name__.lower(), object_id=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def update_post_count(instance, **kwargs):
+    """
+    Record the post for its thread's count and positions to be fixed once
+    per thread on commit, not once per post of a bulk or cascade delete.
+    """
+    pending = getattr(_deleted_posts, 'pending', None)
+    # Dropped with its callback if the transaction rolled back
+    registered = pending is not None and \
+        any(func is pending for _, func in connection.run_on_commit)
+    if not registered:
+        pending = _deleted_posts.pending = DeletedPosts()
+    if instance.thread_id not in pending:
+        # Read while the thread still exists, before a cascade deletes it
+        pending[instance.thread_id] = [
+            Thread.objects.filter(pk=instance.thread_id)
+            .values_list('category_id', flat=True).first(),
+            0, instance.position]
+    counts = pending[instance.thread_id]
+    counts[1] += 1
+    counts[2] = min(counts[2], instance.position)
+    if not registered:  # Run at once outside of a transaction
+        transaction.on_commit(pending)
 
 
 @receiver(post_save, sender=Thread)
@@ -0,0 +1,115 @@
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime
+
+from user.models import ForumUser
+from .models import Category, Thread, Post
+from .util import PositionPaginator, ThreadPaginator
+from .views import get_first_unread_posts, get_page
+
+PAGINATIONS = [(5, 0), (5, 2), (30, 2)]  # (per_page, orphans)
+
+
+def pages(paginator):
+    return [list(paginator.page(i).object_list)
+            for i in paginator.page_range]
+
+
+class PaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ForumUser.objects.create_user(
+            username='jacob', email='jacob@test.com', password='top_secret')
+        cls.category = Category.objects.create(
+            slug='jeux', title='Jeux', subtitle='Jeux')
+        now = timezone.now()
+        # Stickies and ties on modified exercise the whole seek ordering
+        cls.threads = [Thread.objects.create(
+            title='Thread {}'.format(i), author=cls.user,
+            category=cls.category, isSticky=(i % 17 == 0),
+            modified=now - datetime.timedelta(minutes=i % 20))
+            for i in range(40)]
+
+    def setUp(self):
+        self.client.login(username='jacob', password='top_secret')
+
+    def test_thread_pages(self):
+        pks = [t.pk for t in self.threads]
+        for count in (0, 1, 5, 6, 7, 8, 31, 32, 33, 40):
+            threads = self.category.threads.filter(pk__in=pks[:count])
+            for per_page, orphans in PAGINATIONS:
+                expected = pages(Paginator(threads, per_page, orphans))
+                paginator = ThreadPaginator(threads, per_page, orphans)
+                self.assertEqual(pages(paginator), expected)
+                for i in paginator.page_range[:-1]:
+                    after = paginator.page(i).next_cursor.split('=')[1]
+                    self.assertEqual(list(ThreadPaginator(
+                        threads, per_page, orphans, after=after
+                    ).page(i + 1).object_list), expected[i], (count, i))
+                    before = paginator.page(i + 1).previous_cursor\
+                        .split('=')[1]
+                    self.assertEqual(list(ThreadPaginator(
+                        threads, per_page, orphans, before=before
+                    ).page(i).object_list), expected[i - 1], (count, i))
+
+    def test_post_pages(self):
+        thread = self.threads[0]
+        for count in range(40):
+            if count:
+                Post.objects.create(thread=thread, author=self.user,
+                                    content_plain='Post')
+            posts = thread.posts.all()
+            for per_page, orphans in PAGINATIONS:
+                paginator = PositionPaginator(posts, per_page, orphans)
+                self.assertEqual(
+                    pages(paginator),
+                    pages(Paginator(posts, per_page, orphans)), count)
+
+    def test_last_page(self):
+        thread = self.threads[1]
+        for _ in range(63):
+            Post.objects.create(thread=thread, author=self.user,
+                                content_plain='Post')
+        for url, objects in (
+                (reverse('forum:thread', args=['jeux', thread.slug]),
+                 thread.posts.all()),
+                (reverse('forum:category', args=['jeux']),
+                 self.category.threads.filter(visible=True))):
+            response = self.client.get(url, {'page': 'last'})
+            self.assertEqual(
+                list(response.context['page_obj'].object_list),
+                pages(Paginator(objects, 30, 2))[-1], url)
+
+    def test_moved_post(self):
+        source, thread = self.threads[2:4]
+        moved = Post.objects.create(thread=source, author=self.user,
+                                    content_plain='Moved')
+        for _ in range(8):
+            Post.objects.create(thread=thread, author=self.user,
+                                content_plain='Post')
+        moved.thread = thread
+        moved.save()
+        # The moved post comes last despite its lower pk
+        paginator = PositionPaginator(thread.posts.all(), 5, 0)
+        posts = [p for page in pages(paginator) for p in page]
+        self.assertEqual([p.position for p in posts], list(range(9)))
+        self.assertEqual(posts[-1], moved)
+        unread = get_first_unread_posts({
+            thread.pk: moved.created - datetime.timedelta(seconds=1)})
+        self.assertEqual(unread[thread.pk][0], posts[0])
+
+    def test_get_page(self):
+        for count in range(1, 70):
+            for per_page, orphans in PAGINATIONS:
+                paginator = Paginator(range(count), per_page, orphans)
+                for number in paginator.page_range:
+                    page = paginator.page(number)
+                    for index in (page.start_index() - 1,
+                                  page.end_index() - 1):
+                        self.assertEqual(
+                            get_page(index, count, per_page, orphans),
+                            number, (count, per_page, orphans, index))
@@ -1,7 +1,11 @@
 from django.utils.six.moves.html_parser import HTMLParser
 from django.template.defaultfilters import urlize as django_urlize
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db.models import Q, Max
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.conf import settings
+from django.contrib.postgres.search import SearchQuery
 
 from urllib.parse import quote
 
@@ -32,6 +36,8 @@ def get_query(query_string, search_fields):
     """
     Returns a query, that is a combination of Q objects. That combination
     aims to search keywords within a model by testing the given search fields.
+    The icontains lookups of thread titles and usernames are served by
+    trigram indexes on UPPER(field::text), the SQL Django emits.
     """
     query = None  # Query to search for every search term
     terms = normalize_query(query_string)
@@ -50,6 +56,99 @@ def get_query(query_string, search_fields):
     return query
 
 
+def get_search_query(query_string, config='french'):
+    """
+    Returns a full-text query matching all the keywords of the query string,
+    those of quoted terms included.
+    """
+    query = None
+    for term in normalize_query(query_string):
+        term_query = SearchQuery(term, config=config)
+        query = term_query if query is None else query & term_query
+    return query
+
+
+# Pagination
+class PositionPaginator(Paginator):
+    """
+    Paginate a thread's posts on their position instead of OFFSET, so that
+    the last page of a long thread costs the same as the first one.
+    """
+
+    @cached_property
+    def count(self):
+        return self.object_list.aggregate(
+            count=Coalesce(Max('position') + 1, 0))['count']
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        return self._get_page(
+            self.object_list.filter(position__gte=bottom, position__lt=top)
+            .order_by('position'), number, self)
+
+
+class ThreadPaginator(Paginator):
+    """
+    Paginate threads ordered by (-isSticky, -modified, pk). Given the last
+    thread of the previous page (after) or the first one of the next page
+    (before), the page is sought from it instead of using OFFSET.
+    """
+
+    def __init__(self, *args, after=None, before=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after, self.before = after, before
+
+    def seek(self, cursor, forward):
+        """Return the threads of the page next to cursor, None if invalid."""
+        try:
+            cursor = self.object_list.values_list(
+                'isSticky', 'modified', 'pk').filter(pk=int(cursor)).first()
+        except (TypeError, ValueError):
+            cursor = None
+        if cursor is None:
+            return None
+        sticky, modified, pk = cursor
+        if forward:
+            threads = list(self.object_list.filter(
+                Q(isSticky__lt=sticky) |
+                Q(isSticky=sticky, modified__lt=modified) |
+                Q(isSticky=sticky, modified=modified, pk__gt=pk)
+            )[:self.per_page + self.orphans + 1])
+            # Like with OFFSET, the last page takes the orphans
+            if len(threads) > self.per_page + self.orphans:
+                threads = threads[:self.per_page]
+            return threads
+        threads = list(self.object_list.filter(
+            Q(isSticky__gt=sticky) |
+            Q(isSticky=sticky, modified__gt=modified) |
+            Q(isSticky=sticky, modified=modified, pk__lt=pk)
+        ).reverse()[:self.per_page])
+        return threads[::-1]
+
+    def page(self, number):
+        number = self.validate_number(number)
+        threads = None
+        if self.after is not None and number > 1:
+            threads = self.seek(self.after, forward=True)
+        elif self.before is not None and number < self.num_pages:
+            threads = self.seek(self.before, forward=False)
+        if threads is None:
+            bottom = (number - 1) * self.per_page
+            top = bottom + self.per_page
+            if top + self.orphans >= self.count:
+                top = self.count
+            threads = list(self.object_list[bottom:top])
+        page = self._get_page(threads, number, self)
+        if threads:
+            page.previous_cursor = 'before={}'.format(threads[0].pk)
+            page.next_cursor = 'after={}'.format(threads[-1].pk)
+        return page
+
+
 # Misc
 def keygen():
     import random
@@ -4,47 +4,81 @@ from django.views.generic import View, ListView, CreateView, UpdateView,\
 from django.core.urlresolvers import reverse_lazy, reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.contrib.postgres.search import SearchRank
+from django.db.models import Count, F, Max, OuterRef, Subquery
 from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
 from django.core.cache.utils import make_template_fragment_key
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.contrib import messages
 from django.utils import timezone
 from django.conf import settings
 
-import re
+from math import ceil
+import time
 
-from .models import Category, Thread, Post, Preview, PollQuestion
+from .models import Category, Thread, Post, Preview, PollQuestion, \
+    prefetch_html_and_authors, prefetch_category_summaries, \
+    prefetch_thread_summaries, thread_contributors, search_key, \
+    SEARCH_CONFIG, SEARCH_GENERATION_KEY
 from .forms import ThreadForm, PostForm, PollThreadForm, QuestionForm, \
     ChoicesFormSet, FormSetHelper
-from .util import get_query
+from .util import get_query, get_search_query, PositionPaginator, \
+    ThreadPaginator
 from user.models import CategoryTimeStamp, Bookmark
+from utils.bbcode import strip_tags, to_bbcode
+from utils.counters import view_counter
 
 
 THREADVIEW_PAGINATE_BY = 30
 POSTVIEW_PAGINATE_BY = 30
+SEARCH_COUNT_CAP = 1000
+SEARCH_CACHE_TIMEOUT = 5 * 60
 
 
 # Helpers #
 def get_post_page(thread, post):
+    """Return page number the post is on."""
+    count = thread.posts.aggregate(count=Max('position') + 1)['count']
+    return get_page(post.position, count)
+
+
+def get_page(index, count, per_page=POSTVIEW_PAGINATE_BY, orphans=2):
     """
-    Return page number the post is on.
-    Let's build a paginator object and check if our post is on the expected
-    page. If not (because of PostView.paginate_orphans), return next page.
+    Return the page number of the item at `index` (0-based) in a list of
+    `count` items paginated like PostView.
+    The last page takes up to `orphans` extra items.
     """
-    queryset = Post.objects.filter(thread=thread)
-    page_size = PostView.paginate_by
-    paginator = Paginator(
-        queryset, page_size, orphans=PostView.paginate_orphans,
-        allow_empty_first_page=False)
-    index = queryset.filter(pk__lt=post.pk).count()
-    page_number = max(index // PostView.paginate_by, 1)
-    page = paginator.page(page_number)
-    if post in page.object_list:
-        return page_number
-    else:
-        return page_number + 1
+    num_pages = max(1, ceil(max(1, count - orphans) / per_page))
+    return min(index // per_page + 1, num_pages)
+
+
+def get_first_unread_posts(bookmarks):
+    """
+    Return, for a dict thread_pk:timestamp, a dict thread_pk:(post, page)
+    with the first post created after timestamp in each thread and its
+    page, with a single query.
+    """
+    if not bookmarks:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT DISTINCT ON (p.thread_id) p.thread_id, p.id, p.position, (
+                SELECT MAX(position) + 1 FROM forum_post
+                WHERE thread_id = p.thread_id
+            )
+            FROM forum_post p
+            JOIN unnest(%s::integer[], %s::timestamptz[])
+                AS b(thread_id, timestamp) ON b.thread_id = p.thread_id
+            WHERE p.created > b.timestamp
+            ORDER BY p.thread_id, p.position
+            """,
+            [list(bookmarks), list(bookmarks.values())])
+        return {thread: (Post(pk=post), get_page(position, count))
+                for thread, post, position, count in cursor.fetchall()}
 
 
 def update_category_timestamp(category, user):
@@ -68,63 +102,56 @@ class ThreadStatusMixin(object):
     """Populate thread status."""
 
     def get_context_data(self, **kwargs):
-
-        def get_bookmarked_post(thread, bookmark):
-            """Return latest read post and page from bookmark timestamp."""
-            post = Post.objects\
-                       .filter(thread=thread, created__gt=bookmark)\
-                       .only('id', 'pk').first()
-            if post:
-                page = get_post_page(thread, post)
-                return post, page
-            else:
-                return post, None
-
-        user_id = self.request.user.id
+        user = self.request.user
         context = super().get_context_data(**kwargs)
-        bookmarks = self.request.user.cached_bookmarks
-        for t in context['object_list']:
-            # get thread's bookmark and check if there are unread items
-            b = bookmarks.get(t.pk, None)
-            if b:
-                unread_items = t.modified > b
-            else:
-                unread_items = (True if t.modified >
-                                self.request.user.resetDateTime else False)
-            key = make_template_fragment_key(
-                'thread_status',
-                [t.pk, self.request.user.pk, self.request.user.resetDateTime]
-            )
-            cached = cache.get('read_status/{}/{}'.format(user_id, t.id))
-            # check whether additional calculation is needed
-            if (key in cache and cached == 'unread' and unread_items) or \
-               (key in cache and cached == 'read' and not unread_items):
-                continue
-            else:
-                cache.delete(key)
+        threads = prefetch_thread_summaries(context['object_list'])
+        bookmarks = user.cached_bookmarks
+        # check if there are unread items since thread's bookmark
+        unread_items = {
+            t.pk: t.modified > bookmarks.get(t.pk, user.resetDateTime)
+            for t in threads
+        }
+        fragment_keys = {t.pk: make_template_fragment_key(
+            'thread_status', [t.pk, user.pk, user.resetDateTime])
+            for t in threads}
+        status_keys = {t.pk: 'read_status/{}/{}'.format(user.id, t.pk)
+                       for t in threads}
+        cached = cache.get_many(
+            list(fragment_keys.values()) + list(status_keys.values()))
+        # check whether additional calculation is needed
+        threads = [
+            t for t in threads
+            if fragment_keys[t.pk] not in cached or
+            cached.get(status_keys[t.pk]) !=
+            ('unread' if unread_items[t.pk] else 'read')
+        ]
+        if not threads:
+            return context
+        cache.delete_many([fragment_keys[t.pk] for t in threads])
+        # threads in which user is a contributor
+        contributed = {pk for pk, ids in thread_contributors(threads).items()
+                       if user.id in ids}
+        # first unread post of threads with a bookmark
+        first_unread = get_first_unread_posts({
+            t.pk: bookmarks[t.pk] for t in threads
+            if unread_items[t.pk] and t.pk in bookmarks})
+        statuses = {}
+        for t in threads:
             # add bookmark and page to thread object
-            if b:
-                t.bookmark, t.page = get_bookmarked_post(t, b)
+            if not unread_items[t.pk]:
+                status = 'read'
+                t.bookmark = None
+            elif t.pk in bookmarks:
+                status = 'unread'
+                t.bookmark, t.page = first_unread.get(t.pk, (None, None))
             else:
+                status = 'unread'
                 t.bookmark, t.page = True, 1
-            # now check if user is a contributor in this thread
-            is_contributor = (
-                True if t.contributors.filter(id=user_id) else False
-            )
-            # now we've got all the data we needed, let's choose the correct
-            # status icon and behaviour
-            if unread_items:
-                status = 'unread_contributor' if is_contributor else 'unread'
-                cache.set(
-                    'read_status/{}/{}'.format(user_id, t.id), 'unread', None
-                )
-            else:
-                status = 'read_contributor' if is_contributor else 'read'
-                t.bookmark = None
-                cache.set(
-                    'read_status/{}/{}'.format(user_id, t.id), 'read', None
-                )
+            statuses[status_keys[t.pk]] = status
+            if t.pk in contributed:
+                status += '_contributor'
             t.status = 'img/{}.png'.format(status)
+        cache.set_many(statuses, None)
         return context
 
 
@@ -151,17 +178,32 @@ class CategoryView(LoginRequiredMixin, ListView):
     model = Category
     context_object_name = 'categories'
 
+    def get_queryset(self):
+        latest_thread = Thread.objects.filter(category=OuterRef('pk'))\
+            .order_by('-modified').values('pk')[:1]
+        return Category.objects.annotate(
+            thread_count=Count('threads'),
+            latest_thread_id=Subquery(latest_thread))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        timestamps = CategoryTimeStamp.objects.filter(user=self.request.user)
-        for c in context['categories']:
-            # to avoid non existent timestamps
-            timestamp, created = timestamps.get_or_create(
-                category=c, user=self.request.user)
+        categories = prefetch_category_summaries(context['categories'])
+        timestamps = dict(CategoryTimeStamp.objects
+                          .filter(user=self.request.user)
+                          .values_list('category', 'timestamp'))
+        # to avoid non existent timestamps
+        now = timezone.now()
+        CategoryTimeStamp.objects.bulk_create(
+            CategoryTimeStamp(category=c, user=self.request.user,
+                              timestamp=now)
+            for c in categories if c.pk not in timestamps)
+        for c in categories:
             # compute and add read/unread status to category object
             c.status = 'img/{}.png'.format(
-                "unread" if c.threads.count() != 0 and
-                c.threads.latest().modified > timestamp.timestamp else "read")
+                "unread" if c.latest_thread and
+                c.latest_thread.modified > timestamps.get(c.pk, now)
+                else "read")
+        context['categories'] = categories
         return context
 
 
@@ -169,6 +211,7 @@ class ThreadView(LoginRequiredMixin, ThreadStatusMixin, CategoryReadMixin,
                  ListView):
     paginate_by = THREADVIEW_PAGINATE_BY
     paginate_orphans = 2
+    paginator_class = ThreadPaginator
 
     def get(self, request, *args, **kwargs):
         self.category = get_object_or_404(
@@ -179,6 +222,12 @@ class ThreadView(LoginRequiredMixin, ThreadStatusMixin, CategoryReadMixin,
         """Get the threads to be displayed."""
         return self.category.threads.filter(visible=True)
 
+    def get_paginator(self, *args, **kwargs):
+        """Seek from the adjacent page's thread in the url, if any."""
+        return super().get_paginator(
+            *args, after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'), **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
@@ -188,6 +237,7 @@ class ThreadView(LoginRequiredMixin, ThreadStatusMixin, CategoryReadMixin,
 class PostView(LoginRequiredMixin, CategoryReadMixin, ListView):
     paginate_by = POSTVIEW_PAGINATE_BY
     paginate_orphans = 2
+    paginator_class = PositionPaginator
 
     def get(self, request, *args, **kwargs):
         self.thread = get_object_or_404(
@@ -204,8 +254,7 @@ class PostView(LoginRequiredMixin, CategoryReadMixin, ListView):
         # (so no incr), if None, post has never been visited (so incr)
         increment = self.thread.modified > b if b else True
         if increment:
-            self.thread.viewCount += 1  # Increment views
-            self.thread.save()
+            view_counter.incr(self.thread, 'viewCount')
         # Update thread's bookmark
         Bookmark.objects.update_or_create(
             user=request.user, thread=self.thread)
@@ -224,6 +273,7 @@ class PostView(LoginRequiredMixin, CategoryReadMixin, ListView):
         """Add context data for template."""
         context = super().get_context_data(**kwargs)
         context['thread'] = self.thread
+        prefetch_html_and_authors(context['object_list'])
         return context
 
 
@@ -231,6 +281,11 @@ class PostDetailView(LoginRequiredMixin, DetailView):
     "Displays a single post"
     model = Post
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        prefetch_html_and_authors([self.object])
+        return context
+
 
 # Thread and Post creation and edit #
 class NewThread(LoginRequiredMixin, PreviewPostMixin, CategoryReadMixin,
@@ -257,17 +312,18 @@ class NewThread(LoginRequiredMixin, PreviewPostMixin, CategoryReadMixin,
 
     def form_valid(self, form):
         """Handle thread and 1st post creation in the db"""
-        # Create the thread
-        thread = Thread.objects.create(
-            title=form.cleaned_data['title'],
-            icon=form.cleaned_data['icon'],
-            author=self.request.user,
-            category=self.category,
-            personal=form.cleaned_data['personal'])
-        # Complete the post and save it
-        form.instance.thread = thread
-        form.instance.author = self.request.user
-        form.save()
+        with transaction.atomic():
+            # Create the thread
+            thread = Thread.objects.create(
+                title=form.cleaned_data['title'],
+                icon=form.cleaned_data['icon'],
+                author=self.request.user,
+                category=self.category,
+                personal=form.cleaned_data['personal'])
+            # Complete the post and save it
+            form.instance.thread = thread
+            form.instance.author = self.request.user
+            form.save()
         return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
@@ -281,7 +337,7 @@ class NewPost(LoginRequiredMixin, PreviewPostMixin, CategoryReadMixin,
 
     def dispatch(self, request, *args, **kwargs):
         self.thread = get_object_or_404(
-            Thread,
+            Thread.objects.select_related('category'),
             slug=kwargs['thread_slug'],
             category__slug=kwargs['category_slug'])
         self.category = self.thread.category
@@ -292,8 +348,8 @@ class NewPost(LoginRequiredMixin, PreviewPostMixin, CategoryReadMixin,
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
         context['thread'] = self.thread
-        context['history'] = Post.objects.filter(
-            thread=self.thread).order_by('-pk')[:10]
+        context['history'] = prefetch_html_and_authors(Post.objects.filter(
+            thread=self.thread).order_by('-position')[:10])
         return context
 
     def get_form_kwargs(self):
@@ -327,9 +383,7 @@ class QuotePost(NewPost):
     def get_initial(self):
         "Pass quoted post content as initial data for form"
         initial = super().get_initial()
-        initial_text = re.sub(r'\[quote\][\S|\s]+\[/quote\]\r{0,1}\n{0,1}',
-                              '',
-                              self.p.content_plain)
+        initial_text = to_bbcode(strip_tags(self.p.bbcode, 'quote'))
         text = "[quote][b]{:s} a dit :[/b]\n{:s}[/quote]".format(
             self.p.author.username, initial_text)
         initial['content_plain'] = text
@@ -376,7 +430,7 @@ class EditPost(LoginRequiredMixin, PreviewPostMixin, UpdateView):
     def form_valid(self, form):
         "Handle thread and 1st post creation in the db"
         # Edit thread title if indeed the first post
-        if self.p == self.t.posts.first():
+        if self.p.position == 0:
             self.t.title = form.cleaned_data['title']
             self.t.icon = form.cleaned_data['icon']
             self.t.save()
@@ -525,33 +579,116 @@ class SearchView(LoginRequiredMixin, ThreadStatusMixin, ListView):
         if not self.query:
             messages.error(request, "Aucun terme précisé pour la recherche.")
             return HttpResponseRedirect(reverse('forum:top'))
+        self.mode, self.terms = 'title', self.query
+        for mode in ('user', 'post'):
+            if self.query.startswith(mode + ':'):
+                self.mode, self.terms = mode, self.query[len(mode) + 1:]
         return super().get(request, *args, **kwargs)
 
+    def get_objects(self):
+        """Return the objects searched according to the search mode."""
+        if self.mode == 'post':
+            return Post.objects.select_related('author', 'thread__category')
+        return Thread.objects.filter(visible=True).select_related('category')
+
     def get_queryset(self):
         """Handle search parameters & process search computation."""
-        cls = Thread
-        if re.findall(r'^user:', self.query):
-            entry_query = get_query(self.query[5:], ['author__username'])
-        elif re.findall(r'^post:', self.query):
-            cls = Post
-            entry_query = get_query(self.query[5:], ['content_plain'])
-        else:
-            entry_query = get_query(self.query, ['title'])
-        results = cls.objects.filter(entry_query)
-        if 'visible' in [field.name for field in cls._meta.fields]:
-            results = results.filter(visible="True")
-        self.results_count = results.count()
+        if self.mode == 'user':
+            return self.get_objects().filter(
+                get_query(self.terms, ['author__username']))
+        return self.search(self.get_objects(), self.terms)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Serve the count and the ids of the page's results from the search
+        cache, which is valid until threads or posts are created or edited.
+        """
+        key = search_key(self.mode, self.terms,
+                         self.get_page_number(page_size))
+        generation_key = SEARCH_GENERATION_KEY.format(
+            'post' if self.mode == 'post' else 'thread')
+        cached = cache.get_many([key, generation_key])
+        generation = cached.get(generation_key)
+        if key in cached and cached[key][0] == generation:
+            generation, self.results_count, number, pks = cached[key]
+            results = self.get_objects().in_bulk(pks)
+            paginator = self.get_paginator(
+                queryset, page_size, orphans=self.get_paginate_orphans())
+            page = paginator._get_page(
+                [results[pk] for pk in pks if pk in results], number,
+                paginator)
+            self.add_count_message()
+            return (paginator, page, page.object_list,
+                    page.has_other_pages())
+        if generation is None:
+            generation = int(time.time() * 1000)
+            cache.add(generation_key, generation, None)
+        self.results_count = self.count(queryset)
+        if not self.results_count and self.mode == 'title':
+            # Look for parts of words in titles, e.g. "zeld"
+            queryset = self.get_objects().filter(
+                get_query(self.terms, ['title']))
+            self.results_count = self.count(queryset)
+        self.add_count_message()
+        paginator, page, object_list, is_paginated = \
+            super().paginate_queryset(queryset, page_size)
+        cache.set(key, (generation, self.results_count, page.number,
+                        [o.pk for o in object_list]), SEARCH_CACHE_TIMEOUT)
+        return paginator, page, object_list, is_paginated
+
+    def get_page_number(self, page_size):
+        """
+        Return 'last' or the requested page number, validated against the
+        most pages a capped search can have so that it is safe in a key.
+        """
+        page = self.request.GET.get(self.page_kwarg) or 1
+        if page == 'last':
+            return page
+        paginator = Paginator(range(SEARCH_COUNT_CAP), page_size,
+                              orphans=self.get_paginate_orphans())
+        try:
+            return paginator.validate_number(page)
+        except InvalidPage as e:
+            raise Http404(str(e))
+
+    def add_count_message(self):
         if not self.results_count:
             messages.error(
                 self.request,
                 'Aucun résultat ne correspond à cette recherche.'
             )
+        elif self.results_count > SEARCH_COUNT_CAP:
+            messages.success(
+                self.request,
+                "Plus de {} résultats trouvés.".format(SEARCH_COUNT_CAP)
+            )
         else:
             messages.success(
                 self.request,
                 "{} résultat(s) trouvé(s).".format(self.results_count)
             )
-        return results
+
+    @staticmethod
+    def count(results):
+        """Count results, stopping at the cap not to scan every match."""
+        return results.order_by()\
+            .values('pk')[:SEARCH_COUNT_CAP + 1].count()
+
+    @staticmethod
+    def search(queryset, query_string):
+        """Full-text search the queryset, best ranked results first."""
+        query = get_search_query(query_string, config=SEARCH_CONFIG)
+        if query is None:
+            return queryset.none()
+        return queryset.filter(search_vector=query)\
+            .annotate(rank=SearchRank(F('search_vector'), query))\
+            .order_by('-rank', '-pk')
+
+    def get_paginator(self, *args, **kwargs):
+        """Paginate the capped count instead of counting again."""
+        paginator = super().get_paginator(*args, **kwargs)
+        paginator.count = min(self.results_count, SEARCH_COUNT_CAP)
+        return paginator
 
     def get_context_data(self, **kwargs):
         """Add context data for the template."""
@@ -85,6 +85,7 @@ MIDDLEWARE_CLASSES = (
     "django.contrib.auth.middleware.SessionAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "user.middleware.UserMapMiddleware",
 )
 
 ROOT_URLCONF = "naxos.urls"
@@ -1,10 +1,9 @@
 from django.db import models
 from django.core.exceptions import ValidationError
-from django.core.cache import cache
 from django.utils import timezone
 
 from user.models import ForumUser
-from utils.renderer import render
+from forum.models import CachedAuthorModel, RenderedModel
 
 
 # PM models
@@ -31,7 +30,7 @@ class Conversation(models.Model):
         return str([user.username for user in self.participants.all()])
 
 
-class Message(models.Model):
+class Message(CachedAuthorModel, RenderedModel):
 
     """A message."""
     created = models.DateTimeField(default=timezone.now,
@@ -51,16 +50,9 @@ class Message(models.Model):
         # Update conv datetime
         self.conversation.modified = self.created
         self.conversation.save()
+        self.render_html()
         super().save(*args, **kwargs)
 
-    @property
-    def html(self):
-        html = cache.get('message/{}/html'.format(self.pk))
-        if not html:
-            html = render(self.content_plain, "bbcode")
-            cache.set('message/{}/html'.format(self.pk), html, None)
-        return html
-
     class Meta:
         ordering = ["created"]
         # Permit thread.posts.latest in template
@@ -7,6 +7,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 
 from user.models import ForumUser
+from forum.models import prefetch_html_and_authors
 from .models import Conversation, Message
 from .forms import ConversationForm
 
@@ -63,6 +64,8 @@ class MessageView(LoginRequiredMixin, ListView):
         context['recipient'] = self.c.participants.exclude(
             username=self.request.user).get()
         context['conversation'] = self.c
+        prefetch_html_and_authors(
+            [m for m in context['object_list'] if m.shown])
         return context
 
 
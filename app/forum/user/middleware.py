@@ -0,0 +1,14 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from .models import start_user_map, end_user_map
+
+
+class UserMapMiddleware(MiddlewareMixin):
+    """Give each request its own identity map of cached users."""
+
+    def process_request(self, request):
+        start_user_map()
+
+    def process_response(self, request, response):
+        end_user_map()
+        return response
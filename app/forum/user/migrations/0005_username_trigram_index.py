@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return  # Without contrib, username searches stay unindexed
+    # Same expression as the SQL of Django's icontains and istartswith
+    schema_editor.execute(
+        "CREATE INDEX user_forumuser_username_trgm ON user_forumuser "
+        "USING gin (UPPER(username::text) gin_trgm_ops)")
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS user_forumuser_username_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_remove_forumuser_is_online'),
+        ('forum', '0010_title_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
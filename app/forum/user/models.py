@@ -9,9 +9,12 @@ from django.utils import timezone
 from forum.util import keygen
 
 import datetime
+import threading
 
 FORUM_INIT = timezone.make_aware(datetime.datetime(2013, 1, 1))
 
+_request_users = threading.local()
+
 
 # Model classes
 class ForumUser(AbstractUser):
@@ -139,10 +142,100 @@ class TokenPool(models.Model):
         return self.token
 
 
+# Author cards
+class AuthorCard(object):
+    """
+    What post and thread lists need to know about an author. Cached as a
+    plain tuple under a versioned key instead of a pickled ForumUser.
+    """
+    version = 2
+    __slots__ = ('pk', 'username', 'quote', 'logo_url', 'date_joined')
+
+    def __init__(self, pk, username, quote, logo_url, date_joined):
+        self.pk = pk
+        self.username = username
+        self.quote = quote
+        self.logo_url = logo_url
+        self.date_joined = date_joined
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.pk, user.username, user.quote,
+                   user.logo.url if user.logo else '', user.date_joined)
+
+    @property
+    def is_online(self):
+        """Read live, as the cards are cached with no expiry."""
+        return bool(cache.get(f"user/{self.pk}/is_online"))
+
+    @staticmethod
+    def key(pk):
+        return 'user/{}/card/{}'.format(pk, AuthorCard.version)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __str__(self):
+        return self.username
+
+
+def start_user_map():
+    """Start a new identity map of author cards for the current request."""
+    _request_users.map = {}
+
+
+def end_user_map():
+    _request_users.map = None
+
+
+def user_map():
+    """
+    Return the identity map of the current request as a dict pk:card.
+    Outside of a request, return an empty dict that is not kept.
+    """
+    users = getattr(_request_users, 'map', None)
+    return users if users is not None else {}
+
+
+def cache_author_cards(pks):
+    """Build cards from db, add them to the identity map and to cache."""
+    cards = {pk: AuthorCard.from_user(user)
+             for pk, user in ForumUser.objects.in_bulk(pks).items()}
+    cache.set_many({AuthorCard.key(pk): card.as_tuple()
+                    for pk, card in cards.items()}, None)
+    user_map().update(cards)
+    return cards
+
+
+def author_cards(pks):
+    """
+    Return a dict pk:card from the identity map, else from cache with a
+    single get_many, else from db.
+    """
+    cards = user_map()
+    keys = {AuthorCard.key(pk): pk for pk in set(pks) if pk not in cards}
+    if keys:
+        cached = cache.get_many(list(keys))
+        cards.update({keys[key]: AuthorCard(*values)
+                      for key, values in cached.items() if values})
+        missing = [pk for pk in keys.values() if pk not in cards]
+        if missing:
+            cards.update(cache_author_cards(missing))
+    return {pk: cards[pk] for pk in pks}
+
+
+def author_card(pk):
+    return author_cards([pk])[pk]
+
+
 # Model signal handlers
 @receiver(post_save, sender=ForumUser)
 def update_user_cache(instance, **kwargs):
-    cache.set('user/{}'.format(instance.pk), instance, None)
+    card = AuthorCard.from_user(instance)
+    cache.set(AuthorCard.key(instance.pk), card.as_tuple(), None)
+    cards = user_map()
+    if instance.pk in cards:
+        cards[instance.pk] = card
 
 
 @receiver(post_save, sender=Bookmark)
@@ -17,7 +17,7 @@ from django.db.models import Count
 
 from .forms import RegisterForm, UpdateUserForm, CrispyPasswordForm
 from .models import ForumUser
-from forum.models import Thread
+from forum.models import Thread, prefetch_thread_summaries
 
 
 class Register(CreateView):
@@ -101,15 +101,16 @@ class Top10(LoginRequiredMixin, TemplateView):
     template_name = "user/top10.html"
 
     def dispatch(self, request, *args, **kwargs):
-        threads = Thread.objects.annotate(p_count=Count("posts"))
+        threads = Thread.objects.select_related("category")\
+            .annotate(p_count=Count("posts"))
         self.top_views = threads.order_by("-viewCount")[:10]
         self.top_posts = threads.order_by("-p_count")[:10]
         return super().dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['top_views'] = self.top_views
-        context['top_posts'] = self.top_posts
+        context['top_views'] = prefetch_thread_summaries(self.top_views)
+        context['top_posts'] = prefetch_thread_summaries(self.top_posts)
         return context
 
 
@@ -0,0 +1,236 @@
+from django.core.cache import cache
+from postmarkup import PostMarkup
+
+from hashlib import sha1
+import re
+
+TOKEN_TAG, TOKEN_PTAG, TOKEN_TEXT = PostMarkup.TOKEN_TAG, \
+    PostMarkup.TOKEN_PTAG, PostMarkup.TOKEN_TEXT
+# Shorter texts are tokenized faster than their tokens are fetched
+TOKENS_CACHE_MIN_LENGTH = 10000
+TOKENS_CACHE_KEY = 'bbcode/tokens/{}'
+TOKENS_CACHE_TIMEOUT = 7 * 24 * 3600
+
+
+class Finder(object):
+    """
+    Find the next match of a pattern from increasing positions, scanning
+    each part of the text once.
+    """
+
+    def __init__(self, text, pattern):
+        self.search = re.compile(pattern).search
+        self.text = text
+        self.start = self.found = len(text) + 1  # Nothing searched yet
+
+    def __call__(self, pos):
+        if pos < self.start or pos > self.found != -1:
+            match = self.search(self.text, pos)
+            self.start, self.found = pos, match.start() if match else -1
+        return self.found
+
+
+def tokenize(post):
+    """
+    Same tokens as PostMarkup.tokenize, which looks for each tag with
+    r'\\[.*?\\]' and so takes quadratic time on lines full of brackets.
+    """
+    next_open = Finder(post, r'\[')
+    next_close = Finder(post, r'\]')
+    next_newline = Finder(post, r'\n')
+    next_end_eq = Finder(post, r'\]|\=')
+    next_quote_end = Finder(post, r'\"|\]')
+
+    def tag_start(pos):
+        """First [ from pos closed by a ] on the same line."""
+        while True:
+            start = next_open(pos)
+            if start == -1:
+                return -1
+            close = next_close(start)
+            if close == -1:
+                return -1
+            newline = next_newline(start)
+            if newline == -1 or close < newline:
+                return start
+            pos = newline + 1
+
+    pos = 0
+    while True:
+        brace_pos = tag_start(pos)
+        if brace_pos == -1:
+            if pos < len(post):
+                yield TOKEN_TEXT, post[pos:], pos, len(post)
+            return
+        if brace_pos - pos > 0:
+            yield TOKEN_TEXT, post[pos:brace_pos], pos, brace_pos
+
+        pos = brace_pos
+        end_pos = pos + 1
+
+        open_tag_pos = next_open(end_pos)
+        end_pos = next_end_eq(end_pos)
+        if end_pos == -1:
+            yield TOKEN_TEXT, post[pos:], pos, len(post)
+            return
+
+        if open_tag_pos != -1 and open_tag_pos < end_pos:
+            yield TOKEN_TEXT, post[pos:open_tag_pos], pos, open_tag_pos
+            pos = open_tag_pos
+            continue
+
+        if post[end_pos] == ']':
+            yield TOKEN_TAG, post[pos:end_pos + 1], pos, end_pos + 1
+            pos = end_pos + 1
+            continue
+
+        try:  # post[end_pos] == '='
+            end_pos += 1
+            while post[end_pos] == ' ':
+                end_pos += 1
+            if post[end_pos] != '"':
+                end_pos = post.find(']', end_pos + 1)
+                if end_pos == -1:
+                    return
+                yield TOKEN_TAG, post[pos:end_pos + 1], pos, end_pos + 1
+            else:
+                end_pos = next_quote_end(end_pos)
+                if end_pos == -1:
+                    return
+                if post[end_pos] == '"':
+                    end_pos = post.find('"', end_pos + 1)
+                    if end_pos == -1:
+                        return
+                    end_pos = post.find(']', end_pos + 1)
+                    if end_pos == -1:
+                        return
+                    yield TOKEN_PTAG, post[pos:end_pos + 1], pos, end_pos + 1
+                else:
+                    yield TOKEN_TAG, post[pos:end_pos + 1], pos, end_pos
+            pos = end_pos + 1
+        except IndexError:
+            return
+
+
+class Tag(object):
+    """A bbcode tag and the nodes it encloses, texts being strings."""
+    __slots__ = ('name', 'open', 'close', 'children')
+
+    def __init__(self, name, open):
+        self.name = name
+        self.open = open
+        self.close = ''  # Left empty by unclosed tags
+        self.children = []
+
+    def __repr__(self):
+        return "<Tag {}: {:d} children>".format(self.name, len(self.children))
+
+
+def parse(text, tokens=None):
+    """
+    Return the top-level nodes of the bbcode text, from its `tokens` if
+    given. A closing tag closes the innermost open tag of that name and the
+    tags it contains; one that closes nothing, and what the tokenizer gives
+    up on, are kept as text.
+    """
+    root = Tag(None, '')
+    stack = [root]
+    opened = {}  # name -> how many tags of that name are on the stack
+    end = 0
+    if tokens is None:
+        tokens = tokenize(text)
+    for kind, token, start, _ in tokens:
+        end = start + len(token)
+        if kind == TOKEN_TEXT:
+            stack[-1].children.append(token)
+            continue
+        name, _, closing = PostMarkup.parse_tag_token(token)
+        if not closing:
+            tag = Tag(name, token)
+            stack[-1].children.append(tag)
+            stack.append(tag)
+            opened[name] = opened.get(name, 0) + 1
+        elif opened.get(name):
+            while True:
+                tag = stack.pop()
+                opened[tag.name] -= 1
+                if tag.name == name:
+                    tag.close = token
+                    break
+        else:
+            stack[-1].children.append(token)
+    if end < len(text):
+        root.children.append(text[end:])
+    return root.children
+
+
+def parse_cached(text):
+    """
+    parse(text), the tokens of long texts being cached by content. Unlike
+    the tree, whose pickling recurses once per nesting level, they are flat.
+    """
+    if len(text) < TOKENS_CACHE_MIN_LENGTH:
+        return parse(text)
+    key = TOKENS_CACHE_KEY.format(sha1(text.encode()).hexdigest())
+    tokens = cache.get(key)
+    if tokens is None:
+        tokens = list(tokenize(text))
+        cache.set(key, tokens, TOKENS_CACHE_TIMEOUT)
+    return parse(text, tokens)
+
+
+def to_bbcode(nodes):
+    """Return the bbcode of nodes, as parsed from it."""
+    chunks = []
+    stack = [iter(nodes)]
+    closes = [None]
+    while stack:
+        for node in stack[-1]:
+            if isinstance(node, str):
+                chunks.append(node)
+            else:
+                chunks.append(node.open)
+                stack.append(iter(node.children))
+                closes.append(node.close)
+                break
+        else:
+            stack.pop()
+            close = closes.pop()
+            if close:
+                chunks.append(close)
+    return ''.join(chunks)
+
+
+def strip_tags(nodes, name, depth=0):
+    """
+    Return nodes without the closed `name` tags nested more than `depth`
+    of them deep, nor the line break following each.
+    """
+    kept = []
+    # Nodes of each open tag, how deep it is in `name` tags and its copy
+    stack = [(iter(nodes), 0, kept)]
+    strip_newline = False
+    while stack:
+        children, level, copy = stack[-1]
+        for node in children:
+            if isinstance(node, str):
+                if strip_newline:
+                    node = re.sub(r'^\r?\n?', '', node, count=1)
+                    strip_newline = False
+                if node:
+                    copy.append(node)
+                continue
+            strip_newline = False
+            inner = level + (node.name == name)
+            if node.name == name and node.close and inner > depth:
+                strip_newline = True
+                continue
+            tag = Tag(node.name, node.open)
+            tag.close = node.close
+            copy.append(tag)
+            stack.append((iter(node.children), inner, tag.children))
+            break
+        else:
+            stack.pop()
+            strip_newline = False
+    return kept
@@ -0,0 +1,60 @@
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from collections import Counter, defaultdict
+import atexit
+import threading
+import time
+
+FLUSH_INTERVAL = 60  # seconds
+
+
+class ViewCounter(object):
+    """
+    Count views in the worker's memory and add them to the database in bulk,
+    so that displaying a page never writes to the viewed object's row.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = Counter()  # (model, field, pk) -> views
+        self.flushed = time.monotonic()
+
+    def incr(self, obj, field):
+        with self.lock:
+            self.counts[type(obj), field, obj.pk] += 1
+
+    def flush(self, force=False):
+        """Write views counted since last flush, at most every interval."""
+        with self.lock:
+            if not self.counts or not force and \
+                    time.monotonic() - self.flushed < self.interval:
+                return
+            counts, self.counts = self.counts, Counter()
+            self.flushed = time.monotonic()
+        # One UPDATE ... SET field = field + n per model, field and n
+        updates = defaultdict(list)
+        for (model, field, pk), n in counts.items():
+            updates[model, field, n].append(pk)
+        try:
+            with transaction.atomic():
+                for (model, field, n), pks in updates.items():
+                    model.objects.filter(pk__in=pks)\
+                        .update(**{field: F(field) + n})
+        except Exception:
+            with self.lock:  # Keep the views for the next flush
+                self.counts.update(counts)
+            raise
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush, force=True)
+
+
+@receiver(request_finished)
+def flush_views(sender, **kwargs):
+    """Flush once the response has been sent."""
+    view_counter.flush()
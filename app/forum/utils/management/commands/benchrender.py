@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+import timeit
+
+from utils.renderer import render_text, render_many
+
+# A bit of everything a post usually contains
+PARAGRAPH = (
+    "[quote][b]someone a dit :[/b]\n"
+    "Pas mal :) mais le lien http://example.com/page est mort :/[/quote]\n"
+    "Bah :salut: tu peux [i]essayer[/i] celui-ci : "
+    "[url=http://example.com]example[/url] :green: & re-essaie ;)\n"
+)
+
+
+def synthetic_post(size):
+    """Return a bbcode post of about `size` characters."""
+    return (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+
+
+class Command(BaseCommand):
+    help = ("Time the rendering of synthetic posts of 1, 10 and 100 KB, "
+            "one at a time then in a batch, without the render cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for size in (1000, 10000, 100000):
+            text = synthetic_post(size)
+            timing = min(timeit.repeat(
+                lambda: render_text(text), number=1,
+                repeat=options['repeat']))
+            self.stdout.write("{:>4d} KB: {:8.2f} ms ({:.3f} ms/KB)".format(
+                size // 1000, timing * 1000, timing * 1000000 / size))
+        # Distinct texts, as a batch of duplicates would render only once
+        texts = [synthetic_post(1000) + str(i)
+                 for i in range(options['batch'])]
+        for name, func in (
+                ('render_text()', lambda: [render_text(t) for t in texts]),
+                ('render_many()',
+                 lambda: render_many(
+                     texts, cached=False, pool=True))):
+            timing = min(timeit.repeat(
+                func, number=1, repeat=options['repeat']))
+            self.stdout.write("{:d} x 1 KB, {}: {:8.2f} ms".format(
+                len(texts), name, timing * 1000))
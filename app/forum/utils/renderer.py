@@ -1,14 +1,20 @@
 from django.utils.six.moves.html_parser import HTMLParser
 from django.conf import settings
+from django.core.cache import cache
 
-from urllib.parse import quote
-
+from collections import Counter
+from hashlib import sha1
+from multiprocessing import Pool
+import atexit
 import re
 import os
+import threading
 import postmarkup
 import markdown
 
+from .bbcode import tokenize
 from .extra_tags import SpoilerTag, VideoTag
+from .smileys import get_smiley_engine
 
 
 # Process search queries
@@ -22,25 +28,30 @@ class HTMLFilter(HTMLParser):
 
     def __init__(self):
         HTMLParser.__init__(self, convert_charrefs=False)
-        self.html = str()
+        self.chunks = []
+
+    @property
+    def html(self):
+        return ''.join(self.chunks)
 
     def handle_starttag(self, tag, attrs):
-        self.html += '<{:s}{:s}>'.format(tag, self.__html_attrs(attrs))
+        self.chunks.append('<{:s}{:s}>'.format(tag, self.__html_attrs(attrs)))
 
     def handle_data(self, data):
-        self.html += data
+        self.chunks.append(data)
 
     def handle_startendtag(self, tag, attrs):
-        self.html += '<{:s}{:s}/>'.format(tag, self.__html_attrs(attrs))
+        self.chunks.append(
+            '<{:s}{:s}/>'.format(tag, self.__html_attrs(attrs)))
 
     def handle_endtag(self, tag):
-        self.html += '</{:s}>'.format(tag)
+        self.chunks.append('</{:s}>'.format(tag))
 
     def handle_entityref(self, name):
-        self.html += '&{:s};'.format(name)
+        self.chunks.append('&{:s};'.format(name))
 
     def handle_charref(self, name):
-        self.html += '&#{:s};'.format(name)
+        self.chunks.append('&#{:s};'.format(name))
 
     def unescape(self, s):
         # we don't need unescape data (without this possible XSS-attack)
@@ -82,53 +93,12 @@ class ExcludeTagsHTMLFilter(HTMLFilter):
         super(ExcludeTagsHTMLFilter, self).handle_endtag(tag)
 
 
-# Smiley stuff
-def compile_smileys():
-
-    special_smileys = [
-        (r":-?\)", "special-smile"),
-        (r";-?\)", "special-wink"),
-        (r":-?\(", "special-sad"),
-        (r":o", "-o"),
-        (r":-?D", "green"),
-        (r":-?v", "v"),
-        (r":\?:", "special-question"),
-        (r":\?\?\?:", "special-3question"),
-        (r":jap:", "respect"),
-        (r":clap:", "bravo"),
-    ]
-
-    def get_smileys(path):
-        "Get all smileys"
-        from subprocess import getoutput
-        smileys = getoutput("ls " + path + "/img/smileys/")
-        return [smiley[:-len(".gif")] for smiley in smileys.split("\n")]
-
-    smileys = get_smileys(settings.STATICFILES_DIRS[0])
-    double_colon = filter(lambda s: not s.startswith("special-"), smileys)
-    all_smileys = (
-        [(r":-?\/", "bof")] +  # 1st to avoid replacing other simleys' http://
-        [(":" + re.escape(s) + ":", s) for s in double_colon] +
-        special_smileys
-    )
-
-    return [(re.compile(smiley), name) for smiley, name in all_smileys]
-
-
-def _smiley_replacer(text):
-    for smiley, name in compile_smileys():
-        tag = "<img class=\"smiley\" src=\"{:s}img/smileys/{:s}.gif\">"\
-                    .format(settings.STATIC_URL, quote(name))
-        text = smiley.sub(tag, text)
-    return text
-
-
 def smilify(html):
     """
     Replace text smileys.
     """
     try:
-        parser = ExcludeTagsHTMLFilter(_smiley_replacer)
+        parser = ExcludeTagsHTMLFilter(get_smiley_engine().replace)
         parser.feed(html)
         smiled_html = parser.html
         parser.close()
@@ -139,32 +109,121 @@ def smilify(html):
     return smiled_html
 
 
-# TODO: Remove, make db migration instead
-def rm_legacy_tags(text):
+# Legacy tags, rewritten once by forum's 0013 migration then at save time
+LEGACY_TAGS = {'ita': 'i', 'bold': 'b', 'under': 'u'}
+LEGACY_TAG = re.compile(r'\[(/?)(ita|bold|under)\]')
+
 
+def rm_legacy_tags(text):
     "Replace legacy tags by bbcode"
-    base_tags = [(r'ita', 'i'),
-                 (r'bold', 'b'),
-                 (r'under', 'u')]
-    all_tags = ([(re.escape('[' + old + ']'), '[' + new + ']')
-                for old, new in base_tags] +
-               [(re.escape('[/' + old + ']'), '[/' + new + ']')
-                for old, new in base_tags])
-    query = [(re.compile(old), new) for old, new in all_tags]
-    for old_match, new in query:
-        text = old_match.sub(new, text)
-    return text
+    return LEGACY_TAG.sub(
+        lambda m: '[{}{}]'.format(m.group(1), LEGACY_TAGS[m.group(2)]), text)
 
 
 # Rendering
+# Stored with the html it renders and part of its cache keys: bump it when
+# changing the renderer, extra_tags.py or the smiley set, then run rerender.
+# blog/migrations/0004 stamps version 1 on the Markdown html it freezes.
+RENDERER_VERSION = 1
+# Below this many distinct texts, a process pool costs more than it saves
+POOL_THRESHOLD = 200
+# Rendered html is shared by identical texts, whatever their post or message
+RENDER_CACHE_KEY = 'render/{}'
+RENDER_CACHE_TIMEOUT = 7 * 24 * 3600
+# Hits and misses of the render cache in this process
+render_cache_stats = Counter()
 render_bbcode = postmarkup.create(use_pygments=False, annotate_links=False)
 render_bbcode.add_tag(SpoilerTag, 'spoiler')
 render_bbcode.add_tag(VideoTag, 'video')
+render_bbcode.tokenize = tokenize  # Linear time, same tokens
 
 
-def render(text, markup='bbcode'):
+_markdown = threading.local()
+
+
+def get_markdown():
+    """Return the thread's Markdown converter, created at first use."""
+    converter = getattr(_markdown, 'converter', None)
+    if converter is None:
+        converter = _markdown.converter = markdown.Markdown(
+            safe_mode='escape')
+    return converter
+
+
+def render_text(text, markup='bbcode'):
+    """Render text, bypassing the render cache."""
     if markup == 'bbcode':
-        text = rm_legacy_tags(text)  # TODO: make db migration instead
         return smilify(render_bbcode(text, cosmetic_replace=False))
     elif markup == 'markdown':
-        return markdown.markdown(text, safe_mode='escape')
+        return get_markdown().reset().convert(text)
+
+
+def render_key(text, markup):
+    digest = sha1('{}\n{}\n'.format(RENDERER_VERSION, markup).encode())
+    digest.update(text.encode())
+    return RENDER_CACHE_KEY.format(digest.hexdigest())
+
+
+def render(text, markup='bbcode'):
+    key = render_key(text, markup)
+    html = cache.get(key)
+    if html is None:
+        render_cache_stats['misses'] += 1
+        html = render_text(text, markup)
+        cache.set(key, html, RENDER_CACHE_TIMEOUT)
+    else:
+        render_cache_stats['hits'] += 1
+    return html
+
+
+def render_chunk(args):
+    markup, texts = args
+    return [render_text(text, markup) for text in texts]
+
+
+_pool = None
+
+
+def get_render_pool():
+    """
+    Return the process's render pool, created at first use. Forked workers
+    keep the configured bbcode renderer and smiley engine of the parent.
+    """
+    global _pool
+    if _pool is None:
+        _pool = Pool()
+        atexit.register(_pool.terminate)
+    return _pool
+
+
+def render_many(texts, markup='bbcode', cached=True, pool=False):
+    """
+    Render texts, returning their html in the same order. Identical texts
+    are rendered once, looked up in the render cache with a single
+    get_many, and large batches are spread over a process pool if `pool`,
+    which is not to be forked from web workers.
+    """
+    texts = list(texts)
+    rendered = {}
+    if cached:
+        keys = {text: render_key(text, markup) for text in set(texts)}
+        hits = cache.get_many(list(keys.values()))
+        rendered = {text: hits[key] for text, key in keys.items()
+                    if key in hits}
+        render_cache_stats['hits'] += len(rendered)
+    unique = [text for text in dict.fromkeys(texts) if text not in rendered]
+    processes = os.cpu_count() or 1
+    if not pool or len(unique) < POOL_THRESHOLD or processes == 1:
+        html = render_chunk((markup, unique))
+    else:
+        size = -(-len(unique) // (processes * 4))  # Balance uneven texts
+        chunks = [(markup, unique[i:i + size])
+                  for i in range(0, len(unique), size)]
+        html = [h for chunk in get_render_pool().map(render_chunk, chunks)
+                for h in chunk]
+    if cached and unique:
+        render_cache_stats['misses'] += len(unique)
+        cache.set_many({keys[text]: h for text, h in zip(unique, html)},
+                       RENDER_CACHE_TIMEOUT)
+    rendered.update(zip(unique, html))
+    return [rendered[text] for text in texts]
@@ -0,0 +1,107 @@
+from django.conf import settings
+
+from urllib.parse import quote
+
+import os
+import re
+
+
+# Smileys not spelled as :name:, in replacement order
+SPECIAL_SMILEYS = (
+    ((":)", ":-)"), "special-smile"),
+    ((";)", ";-)"), "special-wink"),
+    ((":(", ":-("), "special-sad"),
+    ((":o",), "-o"),
+    ((":D", ":-D"), "green"),
+    ((":v", ":-v"), "v"),
+    ((":?:",), "special-question"),
+    ((":???:",), "special-3question"),
+    ((":jap:",), "respect"),
+    ((":clap:",), "bravo"),
+)
+# 1st to avoid replacing other smileys' http://
+BOF_SMILEY = ((":/", ":-/"), "bof")
+
+
+class SmileyEngine(object):
+    """
+    Replace text smileys with their <img> tag.
+
+    Smileys used to be applied one regex at a time, each pass running on the
+    output of the previous one: a smiley ranked first wins over a later one
+    it overlaps. The engine keeps that behaviour but looks the whole smiley
+    set up in a single scan of the text.
+    """
+
+    def __init__(self, path, static_url):
+        names = sorted(f[:-len(".gif")] for f in os.listdir(path)
+                       if f.endswith(".gif"))
+        double_colon = [n for n in names if not n.startswith("special-")]
+        smileys = (
+            [BOF_SMILEY] +
+            [((":" + n + ":",), n) for n in double_colon] +
+            list(SPECIAL_SMILEYS)
+        )
+        self.tags = []
+        self.ranks = {}  # literal -> rank of the smiley it belongs to
+        for rank, (literals, name) in enumerate(smileys):
+            self.tags.append(
+                "<img class=\"smiley\" src=\"{:s}img/smileys/{:s}.gif\">"
+                .format(static_url, quote(name)))
+            for literal in literals:
+                self.ranks.setdefault(literal, rank)
+        self.lengths = sorted({len(literal) for literal in self.ranks})
+        self.any_smiley = re.compile("|".join(
+            re.escape(literal)
+            for literal in sorted(self.ranks, key=len, reverse=True)))
+        self.smiley_start = re.compile("[{:s}]".format(re.escape(
+            "".join({literal[0] for literal in self.ranks}))))
+
+    def replace(self, text):
+        first = self.any_smiley.search(text)
+        if first is None:  # Most text chunks have no smiley at all
+            return text
+        # Collect every smiley occurrence, overlapping ones included
+        found = []
+        for start in self.smiley_start.finditer(text, first.start()):
+            i = start.start()
+            for length in self.lengths:
+                if i + length > len(text):
+                    break
+                rank = self.ranks.get(text[i:i + length])
+                if rank is not None:
+                    found.append((rank, i, i + length))
+        # Keep them by rank, skipping those overlapping a better ranked one
+        found.sort()
+        taken = bytearray(len(text))
+        kept = []
+        for rank, i, j in found:
+            if not any(taken[i:j]):
+                taken[i:j] = b"\x01" * (j - i)
+                kept.append((i, j, rank))
+        kept.sort()
+        chunks, position = [], 0
+        for i, j, rank in kept:
+            chunks.append(text[position:i])
+            chunks.append(self.tags[rank])
+            position = j
+        chunks.append(text[position:])
+        return "".join(chunks)
+
+
+_engine = None
+
+
+def get_smiley_engine():
+    """
+    Return the worker's smiley engine, rebuilt when the smiley directory
+    or STATIC_URL changes.
+    """
+    global _engine
+    path = os.path.join(settings.STATICFILES_DIRS[0], "img", "smileys")
+    key = (path, os.stat(path).st_mtime, settings.STATIC_URL)
+    if _engine is None or _engine.key != key:
+        engine = SmileyEngine(path, settings.STATIC_URL)
+        engine.key = key
+        _engine = engine
+    return _engine
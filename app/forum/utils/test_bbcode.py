@@ -0,0 +1,106 @@
+from django.test import SimpleTestCase, override_settings
+from postmarkup import PostMarkup
+
+import pickle
+import random
+import re
+
+from .bbcode import parse, parse_cached, strip_tags, to_bbcode, tokenize
+from .renderer import render, render_text
+
+TOKENS = ["[", "]", "=", "\"", " ", "\n", "\r\n", "\n\n", "x", ":)",
+          "http://example.com ", "[b]", "[/b]", "[i]", "[/i]", "[quote]",
+          "[/quote]", "[quote=bob]", "[url=http://example.com]", "[/url]",
+          "[url=\"a b\"]", "[spoiler]", "[/spoiler]", "[code]", "[/code]",
+          "[list]", "[*]", "[/list]", "[img]", "[/img]", "[size=5]", "[/size]"]
+
+
+def random_texts(count, seed=42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 40)))
+
+
+NESTING_TAGS = ["[quote]", "[quote=bob]", "[spoiler]", "[center]",
+                "[size=5]", "[s]", "[u]", "[b]", "[i]"]
+WORDS = ["Salut", ":)", "http://example.com", "[img]http://example.com/a.png"
+         "[/img]", "tout", "le", "monde", ";)", "\n", "\n\n"]
+
+
+def long_posts(count, seed=42):
+    """Yield posts of 10k+ characters of nested tags and paragraphs."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        chunks = []
+        while sum(map(len, chunks)) < 12000:
+            tags = rng.sample(NESTING_TAGS, rng.randint(0, 4))
+            chunks += tags
+            chunks += [rng.choice(WORDS) for _ in range(rng.randint(0, 8))]
+            chunks += ["[/{}]".format(t[1:-1].split("=")[0])
+                       for t in reversed(tags)]
+            chunks.append(rng.choice(["\n\n", "\r\n\r\n", " "]))
+        yield "".join(chunks)
+
+
+def strip_quotes_regex(text):
+    """Former QuotePost implementation."""
+    return re.sub(r'\[quote\][\S|\s]+\[/quote\]\r{0,1}\n{0,1}', '', text)
+
+
+class BBCodeTreeTest(SimpleTestCase):
+
+    def test_same_tokens_as_postmarkup(self):
+        for text in random_texts(3000):
+            self.assertEqual(list(tokenize(text)),
+                             list(PostMarkup.tokenize(text)), text)
+
+    def test_round_trip(self):
+        for text in random_texts(3000):
+            self.assertEqual(to_bbcode(parse(text)), text)
+
+    def test_strip_quotes(self):
+        for text in ("a\n[quote]b[/quote]\nc",
+                     "[quote]a\n[quote]b[/quote][/quote]\r\nc",
+                     "[quote]unclosed", "no quote"):
+            self.assertEqual(to_bbcode(strip_tags(parse(text), "quote")),
+                             strip_quotes_regex(text))
+        # The regex also dropped what was between two quotes
+        self.assertEqual(to_bbcode(strip_tags(
+            parse("[quote]a[/quote]\nb\n[quote]c[/quote]\nd"), "quote")),
+            "b\nd")
+
+    def test_strip_nested_quotes(self):
+        text = "[quote]a [quote]b [quote]c[/quote][/quote][/quote]"
+        self.assertEqual(to_bbcode(strip_tags(parse(text), "quote", 1)),
+                         "[quote]a [/quote]")
+        self.assertEqual(to_bbcode(strip_tags(parse(text), "quote", 2)),
+                         "[quote]a [quote]b [/quote][/quote]")
+
+    def test_deep_nesting(self):
+        text = "[quote]" * 20000 + "x" + "[/quote]" * 20000
+        self.assertEqual(to_bbcode(parse(text)), text)
+        self.assertEqual(to_bbcode(strip_tags(parse(text), "quote")), "")
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_deep_nesting_cached(self):
+        text = "[quote]" * 20000 + "x" + "[/quote]" * 20000
+        with self.assertRaises(RecursionError):
+            pickle.dumps(parse(text))
+        for _ in range(2):  # Parsed, then from the cached tokens
+            self.assertEqual(to_bbcode(parse_cached(text)), text)
+
+
+class LongPostRenderTest(SimpleTestCase):
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_render_like_the_whole(self):
+        texts = list(long_posts(20))
+        # Inline tags closed and reopened around block tags by postmarkup
+        texts.append(("[u][b][quote=bob][/quote][/b][/u]\n\nx\n\n"
+                      + "Salut :)\n\n" * 1000))
+        for text in texts:
+            html = render_text(text)
+            for _ in range(2):  # Rendered, then from the render cache
+                self.assertEqual(render(text), html)
@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase, override_settings
+from django.conf import settings
+
+from urllib.parse import quote
+
+import os
+import random
+import re
+import shutil
+import tempfile
+
+from .smileys import SmileyEngine, get_smiley_engine
+
+SMILEY_DIR = os.path.join(settings.STATICFILES_DIRS[0], "img", "smileys")
+
+
+def sequential_replace(text, path, static_url):
+    """Former implementation: one regex substitution per smiley."""
+    special_smileys = [
+        (r":-?\)", "special-smile"),
+        (r";-?\)", "special-wink"),
+        (r":-?\(", "special-sad"),
+        (r":o", "-o"),
+        (r":-?D", "green"),
+        (r":-?v", "v"),
+        (r":\?:", "special-question"),
+        (r":\?\?\?:", "special-3question"),
+        (r":jap:", "respect"),
+        (r":clap:", "bravo"),
+    ]
+    smileys = sorted(s[:-len(".gif")] for s in os.listdir(path))
+    double_colon = filter(lambda s: not s.startswith("special-"), smileys)
+    all_smileys = (
+        [(r":-?\/", "bof")] +
+        [(":" + re.escape(s) + ":", s) for s in double_colon] +
+        special_smileys
+    )
+    for smiley, name in all_smileys:
+        tag = "<img class=\"smiley\" src=\"{:s}img/smileys/{:s}.gif\">"\
+            .format(static_url, quote(name))
+        text = re.sub(smiley, tag, text)
+    return text
+
+
+class SmileyEngineTest(SimpleTestCase):
+
+    def setUp(self):
+        self.engine = SmileyEngine(SMILEY_DIR, "/static/")
+
+    def assertSameAsSequential(self, text):
+        self.assertEqual(self.engine.replace(text),
+                         sequential_replace(text, SMILEY_DIR, "/static/"))
+
+    def test_plain_text(self):
+        self.assertEqual(self.engine.replace("no smiley: here"),
+                         "no smiley: here")
+
+    def test_overlapping_smileys(self):
+        for text in (":salut:D:", ":D:salut:", ":?:?:", ":???:?:",
+                     ":-):-(:o:", "http://x :/ :-/ :-o: :o", ":jap::clap:",
+                     ";-);) :vv:v:", ":green:D", ":::lol:::"):
+            self.assertSameAsSequential(text)
+
+    def test_random_text(self):
+        rng = random.Random(42)
+        alphabet = [":", ":", ";", "-", ")", "(", "?", "/", "o", "D", "v",
+                    "lol", "salut", "green", "jap", "clap", " ", "x"]
+        for _ in range(2000):
+            text = "".join(rng.choice(alphabet)
+                           for _ in range(rng.randint(1, 20)))
+            self.assertSameAsSequential(text)
+
+    def test_reload_on_directory_change(self):
+        static = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static)
+        path = os.path.join(static, "img", "smileys")
+        os.makedirs(path)
+        open(os.path.join(path, "foo.gif"), "w").close()
+        with override_settings(STATICFILES_DIRS=(static,)):
+            engine = get_smiley_engine()
+            self.assertIs(get_smiley_engine(), engine)
+            self.assertIn("foo.gif", engine.replace(":foo:"))
+            open(os.path.join(path, "bar.gif"), "w").close()
+            os.utime(path, (0, 0))
+            self.assertIn("bar.gif", get_smiley_engine().replace(":bar:"))